@@ -1,72 +1,317 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import pulp as pu
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import io
+import os
+import matplotlib.pyplot as plt
 
 # Per PDF
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 
+# Thread per il branch-and-bound del solver: lasciamo un core libero per il loop di Streamlit
+SOLVER_THREADS = max(1, (os.cpu_count() or 1) // 2)
+# Limite di tempo (secondi) oltre il quale il solver restituisce la migliore soluzione trovata
+SOLVER_TIME_LIMIT = 30
+# Gap relativo nullo: questi modelli si risolvono all'ottimo esatto in millisecondi, e un gap
+# positivo farebbe passare per "Optimal" piani peggiori (anche B sotto A con budget appena vincolante).
+# Va passato esplicitamente perché HiGHS di default si ferma all'1e-4
+SOLVER_GAP_REL = 0.0
+# Solver MIP: "cbc" (incluso in PuLP) oppure "highs" (modello in memoria, richiede highspy).
+# Sui modelli di questa app CBC è più veloce: resta il default
+SOLVER = "cbc"
+
+@dataclass
+class Campaigns:
+    """
+    Campagne in forma colonnare: un array per ogni campo numerico invece di
+    una lista di dizionari, così solver e risultati lavorano su vettori.
+    """
+    names: list[str]
+    categories: list[str]
+    costs: np.ndarray
+    revenues: np.ndarray
+    revenues_60d: np.ndarray
+
+    @property
+    def n(self):
+        return len(self.names)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Costruisce le colonne da un DataFrame con name/category/cost/revenue/revenue_60d."""
+        return cls(
+            names=df["name"].tolist(),
+            categories=df["category"].tolist(),
+            costs=df["cost"].to_numpy(dtype=float),
+            revenues=df["revenue"].to_numpy(dtype=float),
+            revenues_60d=df["revenue_60d"].to_numpy(dtype=float),
+        )
+
+    def weighted_profits(self, weight_immediate):
+        """Profitto per lead pesato tra margine immediato e margine a 60gg."""
+        return (
+            (self.revenues - self.costs) * weight_immediate
+            + (self.revenues_60d - self.costs) * (1 - weight_immediate)
+        )
+
+def group_identical_campaigns(campaigns, profits):
+    """
+    Raggruppa le campagne con gli stessi parametri nel modello (categoria, costo, profitto).
+    Sono intercambiabili: tenerle separate crea solo simmetrie nel branch-and-bound.
+    Restituisce la lista dei gruppi (array di indici) in ordine di prima apparizione.
+    """
+    # Chiave numerica per campagna: codice della categoria, costo, profitto
+    _, cat_codes = np.unique(campaigns.categories, return_inverse=True)
+    keys = np.column_stack([cat_codes, campaigns.costs, profits])
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    # np.unique ordina le chiavi: i gruppi tornano nell'ordine della loro prima campagna
+    group_ids = np.argsort(np.argsort(first))[inverse.ravel()]
+    order = np.argsort(group_ids, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(group_ids))[:-1])
+
 def solve_mip(
     campaigns, 
+    profit_coef,  # profitto per lead di ogni campagna (coefficienti dell'obiettivo)
     total_leads, 
     corpo_percent, 
     min_share, 
     budget_max,
-    weight_immediate,  # peso per profittabilità immediata (0-1)
 ):
    
+    n = campaigns.n
+    profits = np.asarray(profit_coef, dtype=float)
+
+    # Caso banale: se la campagna più profittevole può prendere da sola tutti i lead
+    # (budget, quota 'corpo' e quote minime della sua categoria rispettati), nessun piano
+    # fa meglio di profitto_max * total_leads e il solver non serve
+    best = int(np.argmax(profits))
+    best_category = campaigns.categories[best]
+    if (
+        campaigns.costs[best] * total_leads <= budget_max
+        and (best_category == "corpo" or corpo_percent * total_leads <= 0)
+        and (min_share <= 0 or campaigns.categories.count(best_category) == 1)
+    ):
+        x_int = np.zeros(n, dtype=np.int64)
+        x_int[best] = total_leads
+        return "Optimal", x_int, float(profits[best] * total_leads)
+
     prob = pu.LpProblem("MktCampaignOptimization", pu.LpMaximize)
-    n = len(campaigns)
 
-    # Variabili x_i >= 0, Intere
-    x = [pu.LpVariable(f"x_{i}", lowBound=0, cat="Integer") for i in range(n)]
+    # Le campagne identiche vengono risolte come un'unica variabile aggregata
+    profits = profits.tolist()
+    groups = group_identical_campaigns(campaigns, profits)
+    costs = campaigns.costs.tolist()
+
+    # Variabili x_g >= 0, Intere: lead totali del gruppo
+    x = [pu.LpVariable(f"x_{g[0]}", lowBound=0, cat="Integer") for g in groups]
+
+    # Un solo passaggio sulle campagne: termini di profitto e costo, indici 'corpo' e per categoria
+    profit_terms = []
+    cost_terms = []
+    corpo_indices = []
+    cat_dict = defaultdict(list)
+    for k, g in enumerate(groups):
+        i = g[0]
+        category = campaigns.categories[i]
+        profit_terms.append((x[k], profits[i]))
+        cost_terms.append((x[k], costs[i]))
+        cat_dict[category].append(k)
+        if category == "corpo":
+            corpo_indices.append(k)
+
+    # Controlli preliminari, senza avviare il solver. In una categoria con k campagne e
+    # k * min_share > 1 le quote minime reggono solo se la categoria resta a zero lead
+    cat_sizes = {category: sum(len(groups[k]) for k in indices) for category, indices in cat_dict.items()}
+    closed = {category for category, size in cat_sizes.items() if size > 1 and size * min_share > 1 + 1e-9}
+    open_groups = [k for k, g in enumerate(groups) if campaigns.categories[g[0]] not in closed]
+    if (
+        not open_groups
+        or ("corpo" in closed and corpo_percent * total_leads > 0)
+        or min(costs[groups[k][0]] for k in open_groups) * total_leads > budget_max
+    ):
+        return "Infeasible", None, None
+    for category in closed:
+        for k in cat_dict[category]:
+            x[k].upBound = 0
+
+    # Senza quote minime la categoria conta solo per il vincolo 'corpo': una campagna che rende
+    # meno e costa almeno quanto un'altra della stessa categoria (o rende uguale e costa di più)
+    # può cederle tutti i lead senza peggiorare nulla, quindi la fissiamo a zero
+    if min_share <= 0:
+        for indices in cat_dict.values():
+            p = np.array([profits[groups[k][0]] for k in indices])
+            c = np.array([costs[groups[k][0]] for k in indices])
+            dominated = (
+                (p[None, :] >= p[:, None]) & (c[None, :] <= c[:, None])
+                & ((p[None, :] > p[:, None]) | (c[None, :] < c[:, None]))
+            ).any(axis=1)
+            for k in np.flatnonzero(dominated):
+                x[indices[k]].upBound = 0
 
     # Funzione Obiettivo: max sum( weighted_profit_i * x_i )
-    profit_expr = []
-    for i, camp in enumerate(campaigns):
-        # Calcola profitto pesato
-        immediate_profit = (camp["revenue"] - camp["cost"]) * weight_immediate
-        profit_60d = (camp["revenue_60d"] - camp["cost"]) * (1 - weight_immediate)
-        weighted_profit = immediate_profit + profit_60d
-        profit_expr.append(weighted_profit * x[i])
-    prob += pu.lpSum(profit_expr), "Total_Weighted_Profit"
+    prob += pu.LpAffineExpression(profit_terms), "Total_Weighted_Profit"
 
     # Vincolo (1): Somma lead = total_leads
-    prob += pu.lpSum(x) == total_leads, "Totale_lead"
+    prob += pu.LpAffineExpression([(var, 1) for var in x]) == total_leads, "Totale_lead"
 
     # Vincolo (2): Somma lead 'corpo' >= corpo_percent * total_leads
-    corpo_indices = [i for i, c in enumerate(campaigns) if c["category"] == "corpo"]
     if corpo_indices:
-        prob += pu.lpSum([x[i] for i in corpo_indices]) >= corpo_percent * total_leads, "Minimo_corpo"
+        prob += pu.LpAffineExpression([(x[k], 1) for k in corpo_indices]) >= corpo_percent * total_leads, "Minimo_corpo"
 
     # Vincolo (3): Ogni campagna >= min_share * (somma x in cat)
-    cat_dict = defaultdict(list)
-    for i, camp in enumerate(campaigns):
-        cat_dict[camp["category"]].append(i)
     for category, indices in cat_dict.items():
-        if len(indices) > 1:
-            sum_cat = pu.lpSum([x[j] for j in indices])
-            for j in indices:
-                prob += x[j] >= min_share * sum_cat, f"MinShare_{category}_{j}"
+        if cat_sizes[category] > 1:
+            # La quota min_share * somma(x) si costruisce una volta per categoria e resta
+            # esplicita in ogni vincolo: con poche campagne per categoria una variabile ausiliaria
+            # sum_cat == somma(x) non fa risparmiare nulla, e con il CBC 2.10.3 incluso in PuLP
+            # ha dato ottimi sbagliati (vedi test_min_share_rows_without_auxiliary_sum)
+            share_cat = pu.LpAffineExpression([(x[k], min_share) for k in indices])
+            for k in indices:
+                size = len(groups[k])
+                j = groups[k][0]
+                if size == 1:
+                    prob += x[k] >= share_cat, f"MinShare_{category}_{j}"
+                    continue
+                # I lead del gruppo si dividono in parti uguali (q o q+1 a testa):
+                # basta che la quota minima q rispetti il vincolo
+                q = pu.LpVariable(f"q_{j}", lowBound=0, cat="Integer")
+                remainder = pu.LpAffineExpression([(x[k], 1), (q, -size)])
+                prob += remainder >= 0, f"Quota_inf_{j}"
+                prob += remainder <= size - 1, f"Quota_sup_{j}"
+                prob += q >= share_cat, f"MinShare_{category}_{j}"
 
     # Vincolo (4): somma(cost_i * x_i) <= budget_max
-    cost_expr = [c["cost"] * x[i] for i, c in enumerate(campaigns)]
-    prob += pu.lpSum(cost_expr) <= budget_max, "BudgetMax"
+    # Qualsiasi soluzione costa al più max(cost_i) * total_leads: sopra questa soglia
+    # il vincolo non può essere attivo (es. Scenario B) e non lo passiamo al solver
+    if max(costs) * total_leads > budget_max:
+        prob += pu.LpAffineExpression(cost_terms) <= budget_max, "BudgetMax"
 
     # Risolvi
-    prob.solve(pu.PULP_CBC_CMD(msg=0))
+    if SOLVER == "highs" and pu.HiGHS().available():
+        # Presolve disattivato: con i vincoli Quota_* il presolve di HiGHS 1.15 dichiara ottime
+        # soluzioni che non lo sono (vedi test_highs_quota_rows_regression)
+        prob.solve(pu.HiGHS(
+            msg=False, threads=SOLVER_THREADS, timeLimit=SOLVER_TIME_LIMIT, gapRel=SOLVER_GAP_REL,
+            presolve="off"
+        ))
+    else:
+        # Niente warm start: con un punto di partenza ammissibile ma non ottimo,
+        # CBC 2.10.3 lo restituisce come "Optimal"
+        solver_options = dict(
+            msg=0, presolve=True, timeLimit=SOLVER_TIME_LIMIT, gapRel=SOLVER_GAP_REL
+        )
+        try:
+            prob.solve(pu.PULP_CBC_CMD(threads=SOLVER_THREADS, **solver_options))
+        except pu.PulpSolverError:
+            # Alcune build di CBC / versioni di PuLP rifiutano -threads: ripiega su un solo thread
+            prob.solve(pu.PULP_CBC_CMD(**solver_options))
     status = pu.LpStatus[prob.status]
-    if status == "Optimal":
-        x_values = [pu.value(var) for var in x]
+    solved = status == "Optimal"
+    # Allo scadere di SOLVER_TIME_LIMIT PuLP riporta "Optimal" anche per la migliore soluzione
+    # trovata finora (ammissibile ma non provata ottima): la restituiamo come "Not Solved",
+    # con i lead solo se rispetta davvero i vincoli
+    if solved and prob.sol_status == pu.LpSolutionIntegerFeasible:
+        status = "Not Solved"
+        solved = prob.valid(1e-4)
+    if solved:
+        # Arrotonda con il metodo dei resti più grandi: i valori del solver possono scostarsi
+        # dall'intero entro la tolleranza, ma la somma deve restare esattamente total_leads
+        values = np.clip(
+            np.fromiter((var.varValue or 0.0 for var in x), dtype=np.float64, count=len(x)), 0.0, None
+        )
+        group_leads = np.floor(values).astype(np.int64)
+        missing = int(total_leads - group_leads.sum())
+        group_leads[np.argsort(group_leads - values, kind="stable")[:missing]] += 1
+        # Ridistribuisce i lead di ogni gruppo sulle campagne originali (q o q+1 a testa)
+        base, extra = np.divmod(group_leads, [len(g) for g in groups])
+        x_int = np.empty(n, dtype=np.int64)
+        for k, g in enumerate(groups):
+            x_int[g] = base[k]
+            x_int[g[:extra[k]]] += 1
         profit = pu.value(prob.objective)
-        return status, x_values, profit
+        return status, x_int, profit
     else:
         return status, None, None
 
+# Combinazioni di parametri tenute in cache: l'esplorazione con gli slider non fa crescere la memoria senza limite
+SOLVE_CACHE_ENTRIES = 256
+
+class _UncachedResult(Exception):
+    """Porta fuori da _solve_mip_cached un risultato di solve_mip da non memorizzare."""
+    def __init__(self, result):
+        super().__init__(result[0])
+        self.result = result
+
+@st.cache_data(show_spinner=False, max_entries=SOLVE_CACHE_ENTRIES)
+def _solve_mip_cached(
+    campaigns,
+    profit_coef,
+    total_leads,
+    corpo_percent,
+    min_share,
+    budget_max,
+):
+    result = solve_mip(
+        campaigns, profit_coef, total_leads, corpo_percent,
+        min_share, budget_max
+    )
+    # st.cache_data non memorizza le eccezioni: un "Not Solved" (limite di tempo)
+    # si ricalcola al prossimo tentativo invece di restare in cache
+    if result[0] == "Not Solved":
+        raise _UncachedResult(result)
+    return result
+
+def solve_mip_cached(*args, **kwargs):
+    """
+    solve_mip memoizzata sugli input del modello: rilanciare l'ottimizzazione
+    con gli stessi dati e parametri non riavvia il solver.
+    Le soluzioni interrotte dal limite di tempo non vengono memorizzate.
+    """
+    try:
+        return _solve_mip_cached(*args, **kwargs)
+    except _UncachedResult as e:
+        return e.result
+
+# Colonne richieste nel CSV -> campi interni delle campagne
+CSV_COLUMNS = {
+    "nome campagna": "name",
+    "categoria campagna": "category",
+    "costo per lead": "cost",
+    "ricavo per lead": "revenue",
+    "ricavo per lead a 60 giorni": "revenue_60d",
+}
+
+@st.cache_data(show_spinner=False)
+def load_campaigns(file_bytes):
+    """
+    Legge il CSV caricato e restituisce (DataFrame originale, Campaigns).
+    Campaigns è None se mancano colonne richieste.
+    Memoizzata sul contenuto del file, così i rerun di Streamlit non rielaborano il CSV.
+    """
+    try:
+        # Parser multithread di Arrow: pyarrow è già una dipendenza di Streamlit
+        df = pd.read_csv(io.BytesIO(file_bytes), engine="pyarrow")
+    except ImportError:
+        df = pd.read_csv(io.BytesIO(file_bytes))
+    data = df.rename(columns=lambda c: c.lower().strip())
+    if not all(r in data.columns for r in CSV_COLUMNS):
+        return df, None
+
+    # La selezione delle colonne è già una copia: la normalizziamo sul posto
+    data = data[list(CSV_COLUMNS)].rename(columns=CSV_COLUMNS)
+    data["name"] = data["name"].astype(str).str.strip()
+    data["category"] = data["category"].astype(str).str.lower().str.strip()
+    numeric = ["cost", "revenue", "revenue_60d"]
+    data[numeric] = data[numeric].astype(float)
+    return df, Campaigns.from_frame(data)
+
 def compute_solution_df(campaigns, x_values, weight_immediate):
     """
     Dato x_values e campaigns, crea un DataFrame con:
@@ -74,59 +319,61 @@ def compute_solution_df(campaigns, x_values, weight_immediate):
       Margine Immediato, Margine 60gg, Margine Pesato
     e aggiunge in fondo una riga TOTALE.
     """
-    results = []
-    cost_sum = 0
-    revenue_sum = 0
-    revenue_60d_sum = 0
-    margin_immediate_sum = 0
-    margin_60d_sum = 0
-    weighted_margin_sum = 0
-    lead_sum = 0
-
-    for i, camp in enumerate(campaigns):
-        leads = int(round(x_values[i] or 0))
-        cost_t = camp["cost"] * leads
-        revenue_t = camp["revenue"] * leads
-        revenue_60d_t = camp["revenue_60d"] * leads
-        
-        margin_immediate_t = (camp["revenue"] - camp["cost"]) * leads
-        margin_60d_t = (camp["revenue_60d"] - camp["cost"]) * leads
-        weighted_margin_t = margin_immediate_t * weight_immediate + margin_60d_t * (1 - weight_immediate)
-
-        cost_sum += cost_t
-        revenue_sum += revenue_t
-        revenue_60d_sum += revenue_60d_t
-        margin_immediate_sum += margin_immediate_t
-        margin_60d_sum += margin_60d_t
-        weighted_margin_sum += weighted_margin_t
-        lead_sum += leads
-
-        results.append({
-            "Campagna": camp["name"],
-            "Categoria": camp["category"],
-            "Leads": leads,
-            "Costo Tot": int(round(cost_t)),
-            "Ricavo Tot": int(round(revenue_t)),
-            "Ricavo 60gg Tot": int(round(revenue_60d_t)),
-            "Margine Immediato": int(round(margin_immediate_t)),
-            "Margine 60gg": int(round(margin_60d_t)),
-            "Margine Pesato": int(round(weighted_margin_t))
-        })
+    costs = campaigns.costs
+    revenues = campaigns.revenues
+    revenues_60d = campaigns.revenues_60d
+    leads = np.asarray(x_values, dtype=np.int64)
+
+    margin_immediate = (revenues - costs) * leads
+    margin_60d = (revenues_60d - costs) * leads
+    # Colonne in euro come matrice (campagne x colonne): un solo arrotondamento per righe e totali
+    values = np.column_stack([
+        costs * leads,
+        revenues * leads,
+        revenues_60d * leads,
+        margin_immediate,
+        margin_60d,
+        margin_immediate * weight_immediate + margin_60d * (1 - weight_immediate),
+    ])
+    money_columns = ["Costo Tot", "Ricavo Tot", "Ricavo 60gg Tot", "Margine Immediato", "Margine 60gg", "Margine Pesato"]
+
+    df = pd.DataFrame({
+        "Campagna": campaigns.names,
+        "Categoria": campaigns.categories,
+        "Leads": leads,
+        **dict(zip(money_columns, np.rint(values).astype(np.int64).T)),
+    })
+    # Aggiungiamo la riga TOTALE come DataFrame a parte, così le colonne numeriche restano intere
+    totals = dict(zip(money_columns, np.rint(values.sum(axis=0)).astype(np.int64).tolist()))
+    totals_row = pd.DataFrame(
+        [{"Campagna": "", "Categoria": "", "Leads": int(leads.sum()), **totals}],
+        index=["TOTALE"],
+    )
+    return pd.concat([df, totals_row])
+
+@st.cache_data(show_spinner=False)
+def render_comparison_chart(costs, weighted_margins, budget_max_A):
+    """
+    Disegna i grafici comparativi A vs B (costi e margine pesato) e restituisce il PNG.
+    Memoizzata sui totali: i rerun che non cambiano i risultati non ridisegnano la figura.
+    """
+    fig, ax = plt.subplots(1, 2, figsize=(10, 5))
+
+    # Grafico 1: Costi
+    ax[0].bar(["Scenario A", "Scenario B"], costs, color=['#FF4B4B', '#FFA07A'])
+    ax[0].set_title("Confronto Costi")
+    ax[0].set_ylim([budget_max_A - 5000, max(costs) + 1000])
 
-    df = pd.DataFrame(results)
-    # Aggiungiamo la riga TOTALE
-    df.loc["TOTALE"] = [
-        "",  # Campagna
-        "",  # Categoria
-        lead_sum,
-        int(round(cost_sum)),
-        int(round(revenue_sum)),
-        int(round(revenue_60d_sum)),
-        int(round(margin_immediate_sum)),
-        int(round(margin_60d_sum)),
-        int(round(weighted_margin_sum))
-    ]
-    return df
+    # Grafico 2: Margine Pesato
+    ax[1].bar(["Scenario A", "Scenario B"], weighted_margins, color=['#FF4B4B', '#FFA07A'])
+    ax[1].set_title("Confronto Margine Pesato")
+    ax[1].set_ylim([min(weighted_margins) - 5000, max(weighted_margins) + 1000])
+
+    # Stesse opzioni di st.pyplot; chiudiamo la figura per non accumularle in pyplot
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buffer.getvalue()
 
 def main():
     st.title("Analisi di Scenario (Budget Limitato vs. Senza Vincolo)")
@@ -145,106 +392,140 @@ def main():
         "Come vuoi inserire i dati?",
         ["Carica CSV", "Inserimento manuale"]
     )
-    campaigns = []
+    campaigns = None
     if mode == "Carica CSV":
         uploaded_file = st.file_uploader("Seleziona il tuo CSV", type=["csv"])
         if uploaded_file:
-            df = pd.read_csv(uploaded_file)
+            df, csv_campaigns = load_campaigns(uploaded_file.getvalue())
             st.write("**Anteprima CSV:**")
             st.dataframe(df.head())
 
-            df.columns = [c.lower().strip() for c in df.columns]
-            required = ["nome campagna", "categoria campagna", "costo per lead", "ricavo per lead", "ricavo per lead a 60 giorni"]
-            if all(r in df.columns for r in required):
-                for _, row in df.iterrows():
-                    name = str(row["nome campagna"]).strip()
-                    category = str(row["categoria campagna"]).lower().strip()
-                    cost_ = float(row["costo per lead"])
-                    revenue_ = float(row["ricavo per lead"])
-                    revenue_60d_ = float(row["ricavo per lead a 60 giorni"])
-
-                    campaigns.append({
-                        "name": name,
-                        "category": category,
-                        "cost": cost_,
-                        "revenue": revenue_,
-                        "revenue_60d": revenue_60d_
-                    })
+            if csv_campaigns is not None:
+                campaigns = csv_campaigns
             else:
-                st.error(f"Mancano colonne: {required}. Controlla il CSV.")
+                st.error(f"Mancano colonne: {list(CSV_COLUMNS)}. Controlla il CSV.")
     else:
-        n = st.number_input("Numero di campagne (2..10):", min_value=2, max_value=10, value=2)
-        for i in range(n):
-            st.markdown(f"**Campagna #{i+1}**")
-            name = st.text_input(f"Nome campagna #{i+1}", key=f"name_{i}")
-            category = st.selectbox(f"Categoria #{i+1}", ["laser", "corpo"], key=f"cat_{i}")
-            cost_ = st.number_input(f"Costo per lead #{i+1}", min_value=0.0, value=10.0, step=1.0, key=f"cost_{i}")
-            revenue_ = st.number_input(f"Ricavo per lead #{i+1}", min_value=0.0, value=30.0, step=1.0, key=f"rev_{i}")
-            revenue_60d_ = st.number_input(f"Ricavo per lead a 60gg #{i+1}", min_value=0.0, value=40.0, step=1.0, key=f"rev60_{i}")
-
-            campaigns.append({
-                "name": name if name else f"Camp_{i+1}",
-                "category": category,
-                "cost": cost_,
-                "revenue": revenue_,
-                "revenue_60d": revenue_60d_
-            })
+        # Un'unica griglia modificabile invece di cinque widget per campagna
+        default_df = pd.DataFrame({
+            "name": ["", ""],
+            "category": ["laser", "laser"],
+            "cost": [10.0, 10.0],
+            "revenue": [30.0, 30.0],
+            "revenue_60d": [40.0, 40.0],
+        })
+        edited = st.data_editor(
+            default_df,
+            num_rows="dynamic",
+            hide_index=True,
+            key="manual_campaigns",
+            column_config={
+                "name": st.column_config.TextColumn("Nome campagna", default=""),
+                "category": st.column_config.SelectboxColumn("Categoria", options=["laser", "corpo"], default="laser", required=True),
+                "cost": st.column_config.NumberColumn("Costo per lead", min_value=0.0, step=1.0, default=10.0, required=True),
+                "revenue": st.column_config.NumberColumn("Ricavo per lead", min_value=0.0, step=1.0, default=30.0, required=True),
+                "revenue_60d": st.column_config.NumberColumn("Ricavo per lead a 60gg", min_value=0.0, step=1.0, default=40.0, required=True),
+            },
+        )
+        edited = edited.dropna(subset=["cost", "revenue", "revenue_60d"]).fillna({"name": "", "category": "laser"})
+        edited["name"] = [name or f"Camp_{i+1}" for i, name in enumerate(edited["name"])]
+        campaigns = Campaigns.from_frame(edited)
 
     st.write("---")
-    if len(campaigns) == 0:
+    if campaigns is None or campaigns.n == 0:
         st.info("Carica il CSV o inserisci i dati manualmente.")
         return
 
-    st.subheader("Parametri di Ottimizzazione")
-    weight_immediate = st.slider(
-        "Peso profittabilità immediata (vs. 60gg):", 
-        0.0, 1.0, 0.5, 0.01,
-        help="1 = solo profitto immediato, 0 = solo profitto a 60gg"
-    )
-    total_leads = st.number_input("Totale dei lead da produrre:", min_value=1, value=10000, step=1)
-    corpo_percent = st.slider("Percentuale minima di lead 'corpo':", 0.0, 1.0, 0.33, 0.01)
-    min_share = st.slider("Percentuale minima su OGNI campagna nella stessa categoria:", 0.0, 1.0, 0.2, 0.01)
+    # Parametri in un form: muovere slider e campi non fa ripartire lo script,
+    # che gira una volta sola alla pressione del pulsante
+    with st.form("params"):
+        st.subheader("Parametri di Ottimizzazione")
+        weight_immediate = st.slider(
+            "Peso profittabilità immediata (vs. 60gg):", 
+            0.0, 1.0, 0.5, 0.01,
+            help="1 = solo profitto immediato, 0 = solo profitto a 60gg"
+        )
+        total_leads = st.number_input("Totale dei lead da produrre:", min_value=1, value=10000, step=1)
+        corpo_percent = st.slider("Percentuale minima di lead 'corpo':", 0.0, 1.0, 0.33, 0.01)
+        min_share = st.slider("Percentuale minima su OGNI campagna nella stessa categoria:", 0.0, 1.0, 0.2, 0.01)
 
-    st.write("**Scenario A**: Budget limitato")
-    budget_max_A = st.number_input("Budget massimo per Scenario A:", min_value=0.0, value=90000.0, step=100.0)
+        st.write("**Scenario A**: Budget limitato")
+        budget_max_A = st.number_input("Budget massimo per Scenario A:", min_value=0.0, value=90000.0, step=100.0)
 
-    st.write("**Scenario B**: Budget illimitato (non modificabile)", 1e9)
+        st.write("**Scenario B**: Budget illimitato (non modificabile)", 1e9)
+        submitted = st.form_submit_button("Esegui Analisi di Scenario")
 
     if "dfA" not in st.session_state:
         st.session_state.dfA = None
     if "dfB" not in st.session_state:
         st.session_state.dfB = None
 
-    if st.button("Esegui Analisi di Scenario"):
-        # Risolvi Scenario A (budget limitato)
-        statusA, xA, profitA = solve_mip(
-            campaigns, total_leads, corpo_percent, 
-            min_share, budget_max_A, weight_immediate
+    # Input correnti del modello: con gli stessi dati e parametri un nuovo click
+    # riusa i risultati già in sessione invece di rilanciare il solver
+    solution_key = (
+        tuple(campaigns.names), tuple(campaigns.categories),
+        campaigns.costs.tobytes(), campaigns.revenues.tobytes(), campaigns.revenues_60d.tobytes(),
+        weight_immediate, total_leads, corpo_percent, min_share, budget_max_A,
+    )
+
+    if submitted and st.session_state.get("solution_key") != solution_key:
+        # Profitto pesato per lead: stesso obiettivo per entrambi gli scenari
+        profit_coef = campaigns.weighted_profits(weight_immediate)
+
+        # Risolvi Scenario B (budget = 1e9) e Scenario A (budget limitato) in parallelo:
+        # CBC gira in un processo separato, quindi i due thread non si contendono il GIL
+        executor = ThreadPoolExecutor(max_workers=2)
+        futureB = executor.submit(
+            solve_mip_cached,
+            campaigns, profit_coef, total_leads, corpo_percent, 
+            min_share, 1e9
+        )
+        futureA = executor.submit(
+            solve_mip_cached,
+            campaigns, profit_coef, total_leads, corpo_percent, 
+            min_share, budget_max_A
         )
-        if statusA != "Optimal":
+        # Non aspettiamo A se non serve: il thread finisce da solo e il risultato resta in cache
+        executor.shutdown(wait=False)
+
+        # B è un rilassamento di A: se la soluzione di B rientra nel budget è ottima
+        # anche per A, che ha gli stessi vincoli più il budget, e il risultato di A si scarta
+        statusB, xB, profitB = futureB.result()
+        if statusB == "Optimal" and campaigns.costs @ xB <= budget_max_A:
+            statusA, xA, profitA = statusB, xB, profitB
+            st.info("Scenario A identico a B: il budget non è vincolante.")
+        else:
+            statusA, xA, profitA = futureA.result()
+
+        # Si controllano entrambi gli esiti prima di toccare la sessione: se uno dei due
+        # scenari fallisce restano i risultati precedenti di A e B, coerenti con solution_key.
+        # "Not Solved" con una soluzione: limite di tempo raggiunto, mostriamo la migliore trovata
+        if statusA == "Not Solved" and xA is not None:
+            st.warning("Scenario A: limite di tempo raggiunto, mostrata la migliore soluzione trovata.")
+        elif statusA != "Optimal":
             st.error(f"Scenario A non ottimale probabilmente il budget non è sufficiente. Status: {statusA}")
             return
 
-        st.session_state.dfA = compute_solution_df(campaigns, xA, weight_immediate)
-
-        # Risolvi Scenario B (budget = 1e9)
-        statusB, xB, profitB = solve_mip(
-            campaigns, total_leads, corpo_percent, 
-            min_share, 1e9, weight_immediate
-        )
-        if statusB != "Optimal":
+        if statusB == "Not Solved" and xB is not None:
+            st.warning("Scenario B: limite di tempo raggiunto, mostrata la migliore soluzione trovata.")
+        elif statusB != "Optimal":
             st.error(f"Scenario B non ottimale o infeasible. Status: {statusB}")
             return
 
+        st.session_state.dfA = compute_solution_df(campaigns, xA, weight_immediate)
         st.session_state.dfB = compute_solution_df(campaigns, xB, weight_immediate)
+        if statusA == "Optimal" and statusB == "Optimal":
+            st.session_state.solution_key = solution_key
+        else:
+            # Soluzioni solo provvisorie: il prossimo invio con gli stessi input riprova a risolvere
+            st.session_state.pop("solution_key", None)
 
     if st.session_state.dfA is not None:
         st.write("## Risultati Scenario A (Budget limitato)")
-        st.table(st.session_state.dfA)
+        st.dataframe(st.session_state.dfA)
 
     if st.session_state.dfB is not None:
         st.write("## Risultati Scenario B (Budget illimitato)")
-        st.table(st.session_state.dfB)
+        st.dataframe(st.session_state.dfB)
 
         # ANALISI CONFRONTO
         st.subheader("Analisi di Scenario: Confronto A vs B")
@@ -282,23 +563,14 @@ def main():
         """)
      # VISUALIZZAZIONE GRAFICI
         st.subheader("Grafici Comparativi")
-        import matplotlib.pyplot as plt
-
-        fig, ax = plt.subplots(1, 2, figsize=(10, 5))
-
-        # Grafico 1: Costi
-        ax[0].bar(["Scenario A", "Scenario B"], [totA["Costo Tot"], totB["Costo Tot"]], color=['#FF4B4B', '#FFA07A'])
-        ax[0].set_title("Confronto Costi")
-        ax[0].set_ylim([budget_max_A - 5000, max(totA["Costo Tot"], totB["Costo Tot"]) + 1000])
-        
-
-        # Grafico 2: Margine Pesato
-        ax[1].bar(["Scenario A", "Scenario B"], [totA["Margine Pesato"], totB["Margine Pesato"]], color=['#FF4B4B', '#FFA07A'])
-        ax[1].set_title("Confronto Margine Pesato")
-        ax[1].set_ylim([min(totA["Margine Pesato"], totB["Margine Pesato"]) - 5000, max(totA["Margine Pesato"], totB["Margine Pesato"]) + 1000])
-        
-
-        st.pyplot(fig)
+        st.image(
+            render_comparison_chart(
+                (int(totA["Costo Tot"]), int(totB["Costo Tot"])),
+                (int(totA["Margine Pesato"]), int(totB["Margine Pesato"])),
+                budget_max_A,
+            ),
+            width="stretch",
+        )
 
     if st.button("Richiedi Analisi AI"):
         if st.session_state.dfA is None or st.session_state.dfB is None:
@@ -0,0 +1,202 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+import pulp as pu
+
+import streamlit_app as app
+
+
+SOLVERS = [
+    "cbc",
+    pytest.param("highs", marks=pytest.mark.skipif(
+        not pu.HiGHS().available(), reason="highspy non installato"
+    )),
+]
+
+
+@pytest.fixture(params=SOLVERS)
+def solver(request, monkeypatch):
+    monkeypatch.setattr(app, "SOLVER", request.param)
+    return request.param
+
+
+def make_campaigns(rows):
+    """rows: tuple (categoria, costo, ricavo, ricavo 60gg), una per campagna."""
+    df = pd.DataFrame(rows, columns=["category", "cost", "revenue", "revenue_60d"])
+    df.insert(0, "name", [f"c{i}" for i in range(len(df))])
+    return app.Campaigns.from_frame(df)
+
+
+def test_highs_quota_rows_regression(solver):
+    # Tre gruppi di campagne identiche (righe Quota_*): con il presolve attivo
+    # HiGHS 1.15.1 restituisce 130 dichiarandolo ottimo, l'ottimo vero è 140
+    campaigns = make_campaigns([
+        ("laser", 12.0, 32.0, 37.0),
+        ("laser", 12.0, 22.0, 27.0),
+        ("laser", 5.0, 15.0, 15.0),
+        ("laser", 12.0, 22.0, 27.0),
+        ("corpo", 5.0, 25.0, 30.0),
+        ("laser", 5.0, 15.0, 15.0),
+        ("corpo", 8.0, 6.0, 11.0),
+        ("laser", 12.0, 22.0, 27.0),
+        ("laser", 12.0, 32.0, 37.0),
+    ])
+    status, x, profit = app.solve_mip(
+        campaigns, campaigns.weighted_profits(1.0), 7, 0.33, 0.0, 42.0
+    )
+    assert status == "Optimal"
+    assert profit == pytest.approx(140.0)
+    assert x.sum() == 7
+
+
+def compositions(total, parts):
+    """Tutti i modi di dividere total lead interi su parts campagne."""
+    if parts == 1:
+        yield (total,)
+        return
+    for first in range(total + 1):
+        for rest in compositions(total - first, parts - 1):
+            yield (first,) + rest
+
+
+def is_feasible(campaigns, x, total_leads, corpo_percent, min_share, budget_max, eps=1e-6):
+    """Vincoli del modello originale, controllati su un'allocazione intera."""
+    x = np.asarray(x)
+    categories = np.array(campaigns.categories)
+    if x.sum() != total_leads or (x < 0).any():
+        return False
+    corpo = categories == "corpo"
+    if corpo.any() and x[corpo].sum() < corpo_percent * total_leads - eps:
+        return False
+    for category in set(campaigns.categories):
+        in_cat = categories == category
+        if in_cat.sum() > 1 and (x[in_cat] < min_share * x[in_cat].sum() - eps).any():
+            return False
+    return campaigns.costs @ x <= budget_max + eps
+
+
+def brute_force(campaigns, profits, total_leads, corpo_percent, min_share, budget_max):
+    """Miglior profitto su tutte le allocazioni ammissibili, None se non ce ne sono."""
+    best = None
+    for x in compositions(total_leads, campaigns.n):
+        if is_feasible(campaigns, x, total_leads, corpo_percent, min_share, budget_max):
+            profit = float(profits @ np.array(x))
+            if best is None or profit > best:
+                best = profit
+    return best
+
+
+def random_instance(rng):
+    rows = [
+        (rng.choice(["laser", "corpo"]), rng.choice([5.0, 8.0, 10.0]),
+         rng.choice([4.0, 12.0, 20.0]), rng.choice([10.0, 25.0]))
+        for _ in range(rng.randint(1, 4))
+    ]
+    # Campagne duplicate: esercitano le variabili di gruppo e le righe Quota_*
+    for _ in range(rng.randint(0, 2)):
+        rows.append(rng.choice(rows))
+    total_leads = rng.randint(1, 7)
+    params = dict(
+        total_leads=total_leads,
+        corpo_percent=rng.choice([0.0, 0.33, 0.5, 1.0]),
+        min_share=rng.choice([0.0, 0.2, 0.34, 0.5, 0.6]),
+        budget_max=rng.choice([1e9, 9.0 * total_leads, 7.0 * total_leads, 5.0 * total_leads]),
+    )
+    return make_campaigns(rows), rng.choice([0.0, 0.5, 1.0]), params
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_solve_mip_matches_brute_force(solver, seed):
+    rng = random.Random(seed)
+    campaigns, weight, params = random_instance(rng)
+    profits = campaigns.weighted_profits(weight)
+
+    status, x, profit = app.solve_mip(campaigns, profits, **params)
+    expected = brute_force(campaigns, profits, **params)
+
+    if expected is None:
+        assert status != "Optimal"
+        assert x is None
+        return
+    assert status == "Optimal"
+    assert x.dtype == np.int64
+    assert is_feasible(campaigns, x, **params)
+    assert profit == pytest.approx(expected, rel=1e-9, abs=1e-6)
+    assert float(profits @ x) == pytest.approx(profit, rel=1e-9, abs=1e-6)
+
+
+@pytest.mark.parametrize("rows, params, expected", [
+    (
+        [("laser", 5.0, 12.0, 25.0), ("laser", 5.0, 12.0, 10.0), ("corpo", 8.0, 4.0, 45.0)],
+        dict(total_leads=100, corpo_percent=0.5, min_share=0.1, budget_max=1e9),
+        150.0,
+    ),
+    (
+        [("laser", 10.0, 12.0, 10.0), ("laser", 8.0, 4.0, 25.0), ("laser", 8.0, 4.0, 25.0)],
+        dict(total_leads=2, corpo_percent=0.5, min_share=0.0, budget_max=1e9),
+        4.0,
+    ),
+])
+def test_warm_start_regression(solver, monkeypatch, rows, params, expected):
+    # Con un warm start ammissibile ma non ottimo ([0, 0, 100] e (0, 2, 0)) CBC 2.10.3
+    # lo restituiva come "Optimal" (-400 e -8): solve_mip non deve più fornire valori iniziali
+    def fail(*args, **kwargs):
+        raise AssertionError("solve_mip non deve passare un warm start al solver")
+    monkeypatch.setattr(pu.LpVariable, "setInitialValue", fail)
+    campaigns = make_campaigns(rows)
+    profits = campaigns.weighted_profits(1.0)
+    status, x, profit = app.solve_mip(campaigns, profits, **params)
+    assert status == "Optimal"
+    assert profit == pytest.approx(expected)
+    assert profit == pytest.approx(brute_force(campaigns, profits, **params))
+    assert is_feasible(campaigns, x, **params)
+
+
+def test_min_share_rows_without_auxiliary_sum(solver):
+    # Con i vincoli di quota scritti su una variabile sum_laser == x_1 + x_2, il preprocess
+    # di CBC 2.10.3 restituisce 65 (5, 1, 1) come ottimo anche senza warm start
+    campaigns = make_campaigns([
+        ("corpo", 8.0, 12.0, 25.0),
+        ("laser", 8.0, 4.0, 10.0),
+        ("laser", 5.0, 12.0, 25.0),
+    ])
+    status, x, profit = app.solve_mip(campaigns, campaigns.weighted_profits(0.5), 7, 0.5, 0.34, 1e9)
+    assert status == "Optimal"
+    assert x.tolist() == [7, 0, 0]
+    assert profit == pytest.approx(73.5)
+
+
+def test_single_best_campaign_skips_solver(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("il solver non deve partire")
+    monkeypatch.setattr(pu.LpProblem, "solve", fail)
+    campaigns = make_campaigns([
+        ("laser", 10.0, 30.0, 40.0),
+        ("laser", 10.0, 20.0, 40.0),
+        ("corpo", 5.0, 6.0, 6.0),
+    ])
+    status, x, profit = app.solve_mip(campaigns, campaigns.weighted_profits(1.0), 50, 0.0, 0.0, 1e9)
+    assert status == "Optimal"
+    assert x.tolist() == [50, 0, 0]
+    assert profit == pytest.approx(1000.0)
+
+
+def test_closed_category_gets_no_leads(solver):
+    # Tre campagne 'laser' con quota minima 0.4 ciascuna: la categoria può solo restare a zero
+    campaigns = make_campaigns([
+        ("laser", 5.0, 50.0, 50.0),
+        ("laser", 5.0, 40.0, 40.0),
+        ("laser", 5.0, 30.0, 30.0),
+        ("corpo", 10.0, 15.0, 15.0),
+    ])
+    profits = campaigns.weighted_profits(1.0)
+    status, x, profit = app.solve_mip(campaigns, profits, 6, 0.0, 0.4, 1e9)
+    assert status == "Optimal"
+    assert x.tolist() == [0, 0, 0, 6]
+    # ...e se anche 'corpo' è chiusa il problema è infeasible senza avviare il solver
+    campaigns = make_campaigns([("corpo", 5.0, 9.0, 9.0)] * 3)
+    status, x, profit = app.solve_mip(campaigns, campaigns.weighted_profits(1.0), 6, 0.5, 0.4, 1e9)
+    assert status == "Infeasible"
+    assert x is None